@@ -7,6 +7,7 @@ from pytz import timezone
 from datetime import timedelta, datetime
 
 import settings
+from load_shedding import PRIORITY_RAW, PRIORITY_DERIVED
 
 def trunc_datetime_to_minutes(datetime):
     return datetime.replace(second=0, microsecond=0)
@@ -41,11 +42,12 @@ class BuildingProcessor:
             self.sensor_data['moist'] = None
 
     def process(self):
-        self.save_sensor_data()
-        self.save_persons_inside()
-        self.save_subjective_evaluation()
-        self.save_deviations()
-        self.save_energy_productivity()
+        schedule = self.connector.schedule
+        schedule(self, self.save_sensor_data, PRIORITY_RAW)
+        schedule(self, self.save_persons_inside, PRIORITY_DERIVED)
+        schedule(self, self.save_subjective_evaluation, PRIORITY_DERIVED)
+        schedule(self, self.save_deviations, PRIORITY_RAW)
+        schedule(self, self.save_energy_productivity, PRIORITY_DERIVED)
 
 
     # Subjective Evaluation
@@ -55,11 +57,16 @@ class BuildingProcessor:
             SELECT value
             FROM ts_movement
             WHERE device_key = %(device_key)s
+            AND datetime BETWEEN %(since)s AND %(timestamp)s
             ORDER BY datetime DESC
             LIMIT 2
             """,
             {
-                'device_key': self.device['key']
+                'device_key': self.device['key'],
+                'since': self.timestamp - settings.STORAGE_QUERY_LOOKBACK,
+                # Only look at movement up to this message, as this step
+                # may be run later by the load shedder.
+                'timestamp': self.timestamp,
             }
         )
 
@@ -81,7 +88,8 @@ class BuildingProcessor:
 
         if last['value'] and not next_to_last['value']:
             self.cur.execute("""
-                    INSERT INTO ts_subjective_evaluation (datetime, value, device_key)
+                    INSERT INTO """ + self.connector.storage.table_for('ts_subjective_evaluation', self.timestamp) + """
+                    (datetime, value, device_key)
                     VALUES (%(datetime)s, %(value)s, %(device_key)s)
                 """,
                 {
@@ -176,7 +184,7 @@ class BuildingProcessor:
 
         self.cur.execute("""
             INSERT INTO
-                ts_energy_productivity
+                """ + self.connector.storage.table_for('ts_energy_productivity', last_room_productivity['datetime']) + """
                 (datetime, device_key, value)
             VALUES
                 (%(datetime)s, %(device_key)s, %(value)s)
@@ -204,7 +212,7 @@ class BuildingProcessor:
             if value is None:
                 continue
 
-            table_name = type_to_table_name[type]
+            table_name = self.connector.storage.table_for(type_to_table_name[type], self.timestamp)
 
             self.cur.execute("""
                 INSERT INTO
@@ -241,9 +249,11 @@ class BuildingProcessor:
                 FROM ts_co2
                 WHERE device_key = %(device_key)s
                 AND value BETWEEN 50 AND 8000
+                AND datetime >= %(since)s
             """, {
                 'device_key': self.device['key'],
                 'current_co2': self.sensor_data['co2'],
+                'since': self.timestamp - settings.STORAGE_QUERY_LOOKBACK,
             })
 
             obj = self.cur.fetchone()
@@ -267,7 +277,7 @@ class BuildingProcessor:
 
         self.cur.execute("""
             INSERT INTO
-                ts_persons_inside
+                """ + self.connector.storage.table_for('ts_persons_inside', self.timestamp) + """
                 (datetime, device_key, value)
             VALUES
                 (%(timestamp)s, %(device_key)s, %(value)s)
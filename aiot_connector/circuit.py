@@ -1,15 +1,18 @@
 # coding: utf-8
 from dateutil import parser, rrule
-from datetime import datetime, timedelta
-
-from pytz import timezone
+from datetime import timedelta
 
 import settings
+from load_shedding import PRIORITY_RAW, PRIORITY_DERIVED
 
 def trunc_datetime_to_hours(datetime):
     return datetime.replace(minute=0, second=0, microsecond=0)
 
 class CircuitProcessor:
+    # device_key -> last hour generate_kwh has checked, so hours without
+    # enough kWm measurements are not checked again for every packet.
+    last_checked_hours = {}
+
     def __init__(self, connector, device, json_data):
         self.connector = connector
         self.cur = connector.cur
@@ -22,16 +25,17 @@ class CircuitProcessor:
         self.packet_number = proto['packet_number']
 
     def process(self):
-        self.save_pulses()
-        self.save_kwm()
-        self.generate_kwh()
+        schedule = self.connector.schedule
+        schedule(self, self.save_pulses, PRIORITY_RAW)
+        schedule(self, self.save_kwm, PRIORITY_RAW)
+        schedule(self, self.generate_kwh, PRIORITY_DERIVED)
 
     ## Pulses
 
     def save_pulses(self):
         self.cur.execute("""
             INSERT INTO
-                ts_pulses
+                """ + self.connector.storage.table_for('ts_pulses', self.timestamp) + """
                 (datetime, device_key, value, packet_number)
             VALUES
                 (%(datetime)s, %(device_key)s, %(value)s, %(packet_number)s)
@@ -51,13 +55,16 @@ class CircuitProcessor:
             FROM ts_pulses
             WHERE packet_number in (%(packet_number_1)s, %(packet_number_2)s)
             AND device_key = %(device_key)s
-            AND datetime > (NOW() - interval '1 day')
+            AND datetime > %(one_day_ago)s
             ORDER BY datetime DESC
         """
         data = {
             'packet_number_1': packet_number,
             'packet_number_2': (packet_number - 1) % 2**16,
-            'device_key': self.device['key']
+            'device_key': self.device['key'],
+            # Passed as a constant (instead of NOW()) so only recent
+            # partitions of ts_pulses are scanned.
+            'one_day_ago': self.timestamp - timedelta(days=1),
         }
         self.cur.execute(sql, data)
         last_pulses = self.cur.fetchall()
@@ -83,7 +90,8 @@ class CircuitProcessor:
         else:
             kwm_avg = kwm1
 
-        self.cur.execute('INSERT INTO ts_kwm (datetime, device_key, value) VALUES (%(datetime)s, %(device_key)s, %(value)s)', {
+        table_name = self.connector.storage.table_for('ts_kwm', self.timestamp)
+        self.cur.execute('INSERT INTO ' + table_name + ' (datetime, device_key, value) VALUES (%(datetime)s, %(device_key)s, %(value)s)', {
             'datetime': self.timestamp,
             'device_key': self.device['key'],
             'value': kwm_avg,
@@ -93,35 +101,44 @@ class CircuitProcessor:
     ## kWh
 
     def _get_first_kwm_timestamp_for_device(self):
-        self.cur.execute('SELECT min(datetime) FROM ts_kwm WHERE device_key = %(device_key)s', {
+        self.cur.execute('SELECT min(datetime) FROM ts_kwm WHERE device_key = %(device_key)s AND datetime >= %(since)s', {
             'device_key': self.device['key'],
+            'since': self.timestamp - settings.STORAGE_QUERY_LOOKBACK,
         })
         return self.cur.fetchone()['min']
 
     def _get_last_kwh_timestamp_for_device(self):
-        self.cur.execute('SELECT max(datetime) FROM ts_kwh WHERE device_key = %(device_key)s', {
+        self.cur.execute('SELECT max(datetime) FROM ts_kwh WHERE device_key = %(device_key)s AND datetime >= %(since)s', {
             'device_key': self.device['key'],
+            'since': self.timestamp - settings.STORAGE_QUERY_LOOKBACK,
         })
         return self.cur.fetchone()['max']
 
     def generate_kwh(self):
-        oslo_tz = timezone('Europe/Oslo')
+        last_checked_hour = self.last_checked_hours.get(self.device['key'])
 
-        last_kwh_timestamp = self._get_last_kwh_timestamp_for_device()
-
-        if last_kwh_timestamp is not None:
-            first_hour_to_check = trunc_datetime_to_hours(last_kwh_timestamp + timedelta(hours=1))
+        if last_checked_hour is not None:
+            first_hour_to_check = last_checked_hour + timedelta(hours=1)
         else:
-            first_kwm_timestamp = self._get_first_kwm_timestamp_for_device()
-            if first_kwm_timestamp is not None:
-                first_hour_to_check = trunc_datetime_to_hours(first_kwm_timestamp)
+            last_kwh_timestamp = self._get_last_kwh_timestamp_for_device()
+            if last_kwh_timestamp is not None:
+                first_hour_to_check = trunc_datetime_to_hours(last_kwh_timestamp + timedelta(hours=1))
             else:
-                return
+                first_kwm_timestamp = self._get_first_kwm_timestamp_for_device()
+                if first_kwm_timestamp is not None:
+                    first_hour_to_check = trunc_datetime_to_hours(first_kwm_timestamp)
+                else:
+                    return
+
+        last_hour = trunc_datetime_to_hours(self.timestamp - timedelta(hours=1))
+        if last_hour < first_hour_to_check:
+            return
 
-        last_hour = trunc_datetime_to_hours(datetime.now(oslo_tz) - timedelta(hours=1))
         for hour_dt in rrule.rrule(rrule.HOURLY, dtstart=first_hour_to_check, until=last_hour):
             self.save_kwh(hour_dt)
 
+        self.last_checked_hours[self.device['key']] = last_hour
+
     def save_kwh(self, hour_to_check):
         self.cur.execute("""
                 SELECT
@@ -147,7 +164,8 @@ class CircuitProcessor:
                         result['num_kwm_measurements'], self.device['key'], hour_to_check)
             return
 
-        self.cur.execute('INSERT INTO ts_kwh (datetime, device_key, value) VALUES (%(datetime)s, %(device_key)s, %(value)s)', {
+        table_name = self.connector.storage.table_for('ts_kwh', hour_to_check)
+        self.cur.execute('INSERT INTO ' + table_name + ' (datetime, device_key, value) VALUES (%(datetime)s, %(device_key)s, %(value)s)', {
             'datetime': str(hour_to_check),
             'device_key': self.device['key'],
             'value': result['kwh_scaled'],
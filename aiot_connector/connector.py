@@ -1,11 +1,15 @@
 # coding: utf-8
+import dateutil.parser
 import json
 import psycopg2
 import requests
+import sys
 from psycopg2.extras import DictCursor
 
 from building import BuildingProcessor
 from circuit import CircuitProcessor
+from load_shedding import LoadShedder
+from storage import StorageManager
 from wristband import WristbandProcessor
 
 import settings
@@ -15,6 +19,8 @@ class Connector:
     def __init__(self, conn):
         self.conn = conn
         self.cur = conn.cursor(cursor_factory=DictCursor)
+        self.load_shedder = LoadShedder(self)
+        self.storage = StorageManager(self)
 
     def _get_device_from_api(self, selector):
         network_key, device_key = selector
@@ -59,6 +65,8 @@ class Connector:
         return self.cur.fetchone()
 
     def process_json(self, json_data):
+        self.load_shedder.update_lag(dateutil.parser.parse(json_data['datetime']))
+
         device = self.get_device_from_selector(json_data['selector'])
         if device is None:
             device = self.create_device_from_selector(json_data['selector'])
@@ -79,11 +87,19 @@ class Connector:
             processor = processor_class(self, device, json_data)
             processor.process()
 
+        self.load_shedder.catch_up()
+        self.storage.maintain()
+
+    def schedule(self, processor, step, priority):
+        self.load_shedder.schedule(processor, step, priority)
+
     def do_hook(self, hook_name, processor):
         if hook_name in settings.HOOKS:
             settings.HOOKS[hook_name](self, processor)
 
     def loop(self):
+        self.storage.maintain()
+
         url = 'https://http.cloud.tiny-mesh.com/v1/message-query/%s/?stream=stream/%s&query=proto/tm.type:event&data-encoding=binary' % (
             settings.TM_NETWORK,
             settings.TM_NETWORK,
@@ -91,7 +107,11 @@ class Connector:
         req = requests.get(url, auth=(settings.TM_USERNAME, settings.TM_PASSWORD), stream=True)
 
         for line in req.iter_lines():
-            if line:
+            if not line:
+                # End of a message or keep-alive. Once the stream is idle,
+                # catch up on deferred steps.
+                self.load_shedder.idle()
+            else:
                 if not line.startswith('data: '):
                     continue
 
@@ -121,6 +141,12 @@ def main():
     conn.autocommit = True
 
     connector = Connector(conn)
+
+    # One-off move of rows written before the ts_* tables were partitioned.
+    if sys.argv[1:] == ['migrate-storage']:
+        connector.storage.migrate_parent_rows()
+        return
+
     connector.loop()
 
 
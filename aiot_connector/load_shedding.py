@@ -0,0 +1,120 @@
+# coding: utf-8
+from collections import OrderedDict
+from datetime import datetime
+
+from dateutil.tz import tzutc
+
+import settings
+
+# Priority classes for processing steps. Raw steps are always executed,
+# derived steps may be deferred or skipped when we fall behind.
+PRIORITY_RAW = 'raw'
+PRIORITY_DERIVED = 'derived'
+
+
+class LoadShedder:
+    def __init__(self, connector):
+        self.connector = connector
+        self.shedding = False
+        self.lag = 0.0
+
+        # (device_key, step name) -> step. Later steps for the same device
+        # replace earlier ones but keep their place in the queue.
+        self.deferred = OrderedDict()
+
+        self.stats = {
+            'executed': 0,
+            'deferred': 0,
+            'coalesced': 0,
+            'skipped': 0,
+            'caught_up': 0,
+        }
+        self.last_report = None
+        self.last_message = None
+
+    def _set_shedding(self, shedding):
+        if shedding == self.shedding:
+            return
+
+        self.shedding = shedding
+        if settings.DEBUG:
+            print '** load shedding %s (lag: %.1fs, deferred: %d)' % (
+                'started' if shedding else 'stopped', self.lag, len(self.deferred))
+
+        self.connector.do_hook('load-shedding', self)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update({
+            'shedding': self.shedding,
+            'lag': self.lag,
+            'queue_length': len(self.deferred),
+        })
+        return stats
+
+    def report(self):
+        """
+        Logs the counters and passes them to the `load-shedding-stats` hook,
+        at most once every LOAD_SHEDDING_REPORT_INTERVAL.
+        """
+        now = datetime.now(tzutc())
+        if self.last_report is not None and now - self.last_report < settings.LOAD_SHEDDING_REPORT_INTERVAL:
+            return
+        self.last_report = now
+
+        stats = self.get_stats()
+        print '- load shedding: %s' % ', '.join('%s=%s' % item for item in sorted(stats.items()))
+        if 'load-shedding-stats' in settings.HOOKS:
+            settings.HOOKS['load-shedding-stats'](self.connector, stats)
+
+    def update_lag(self, timestamp):
+        if timestamp.tzinfo is None:
+            now = datetime.utcnow()
+        else:
+            now = datetime.now(tzutc())
+        self.lag = max((now - timestamp).total_seconds(), 0.0)
+        self.last_message = datetime.now(tzutc())
+
+        if self.lag >= settings.LOAD_SHEDDING_LAG_HIGH_WATERMARK:
+            self._set_shedding(True)
+        elif self.lag <= settings.LOAD_SHEDDING_LAG_LOW_WATERMARK:
+            self._set_shedding(False)
+
+        self.report()
+
+    def idle(self):
+        # Every message is followed by an empty line as well, so the stream
+        # is only idle once no message has arrived for a while.
+        if self.last_message is not None and datetime.now(tzutc()) - self.last_message < settings.LOAD_SHEDDING_IDLE_TIME:
+            return
+
+        # Nothing is waiting in the stream, so we are not lagging behind.
+        self.lag = 0.0
+        self._set_shedding(False)
+        self.catch_up()
+        self.report()
+
+    def schedule(self, processor, step, priority):
+        if priority == PRIORITY_RAW or not self.shedding:
+            step()
+            self.stats['executed'] += 1
+            return
+
+        key = (processor.device['key'], step.__name__)
+        if key in self.deferred:
+            self.deferred[key] = step
+            self.stats['coalesced'] += 1
+        elif len(self.deferred) < settings.LOAD_SHEDDING_MAX_DEFERRED:
+            self.deferred[key] = step
+            self.stats['deferred'] += 1
+        else:
+            self.stats['skipped'] += 1
+
+    def catch_up(self):
+        if self.shedding:
+            return
+
+        for _ in range(min(settings.LOAD_SHEDDING_CATCH_UP_BATCH_SIZE, len(self.deferred))):
+            step = self.deferred.popitem(last=False)[1]
+            step()
+            self.stats['caught_up'] += 1
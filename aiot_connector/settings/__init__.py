@@ -1,3 +1,55 @@
-from .sensitive_settings import *
+from datetime import timedelta
 
 DEBUG = True
+
+# Load shedding. When the stream lag (seconds between a message's timestamp
+# and now) goes above the high watermark, derived processing steps are
+# deferred until it drops below the low watermark again. At most
+# MAX_DEFERRED steps are kept, the rest are skipped.
+#
+# Messages are read one at a time from the stream, so the connector has no
+# queue of its own to measure. Messages waiting on the server are what
+# shows up as lag, which makes lag the queue depth, in seconds.
+LOAD_SHEDDING_LAG_HIGH_WATERMARK = 60
+LOAD_SHEDDING_LAG_LOW_WATERMARK = 10
+LOAD_SHEDDING_MAX_DEFERRED = 1000
+LOAD_SHEDDING_CATCH_UP_BATCH_SIZE = 10
+# Time without messages after which the stream counts as idle, which stops
+# load shedding.
+LOAD_SHEDDING_IDLE_TIME = timedelta(seconds=5)
+# How often the load shedding counters are logged and passed to the
+# 'load-shedding-stats' hook.
+LOAD_SHEDDING_REPORT_INTERVAL = timedelta(minutes=1)
+
+# Storage. Tables listed here are split into time-range partitions of one
+# `interval` ('day' or 'month'). Partitions older than `retention` (a
+# timedelta, or None to keep everything) are dropped, or moved to
+# STORAGE_ARCHIVE_SCHEMA if `archive` is set.
+#
+# Rows written before a table was partitioned stay in the table itself,
+# which is always scanned and never expired. Move them into partitions once
+# with `python connector.py migrate-storage`.
+STORAGE_TABLES = dict((table_name, {'interval': 'month', 'retention': None, 'archive': False}) for table_name in [
+    'ts_temperature',
+    'ts_co2',
+    'ts_light',
+    'ts_moist',
+    'ts_movement',
+    'ts_decibel',
+    'ts_persons_inside',
+    'ts_subjective_evaluation',
+    'ts_energy_productivity',
+    'ts_pulses',
+    'ts_kwm',
+    'ts_kwh',
+    'ts_wristband_location',
+    'ts_wristband_button_push',
+])
+STORAGE_PARTITIONS_AHEAD = 2
+STORAGE_ARCHIVE_SCHEMA = 'archive'
+STORAGE_MAINTENANCE_INTERVAL = timedelta(hours=1)
+# Derived metrics only look at rows this recent, so their queries only
+# touch the latest partitions.
+STORAGE_QUERY_LOOKBACK = timedelta(days=7)
+
+from .sensitive_settings import *
@@ -0,0 +1,286 @@
+# coding: utf-8
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from dateutil.tz import tzutc
+
+import settings
+
+# Time-range partitions are plain child tables inheriting from the ts_*
+# table, with a CHECK constraint on `datetime`. Queries against the parent
+# table with a constant `datetime` range only scan the matching partitions
+# (constraint exclusion), inserts are routed to the child table directly.
+
+PARTITION_INTERVALS = {
+    'day': ('%Y%m%d', relativedelta(days=1)),
+    'month': ('%Y%m', relativedelta(months=1)),
+}
+
+
+def to_utc(dt):
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=tzutc())
+    return dt.astimezone(tzutc())
+
+
+def trunc_datetime_to_interval(dt, interval):
+    dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'month':
+        dt = dt.replace(day=1)
+    return dt
+
+
+class StorageManager:
+    def __init__(self, connector):
+        self.connector = connector
+        self.cur = connector.cur
+        self.known_partitions = set()
+        self.last_maintenance = None
+
+    def _get_policy(self, table_name):
+        return settings.STORAGE_TABLES.get(table_name)
+
+    def _partition_name(self, table_name, start, interval):
+        name_format = PARTITION_INTERVALS[interval][0]
+        return '%s_p%s' % (table_name, start.strftime(name_format))
+
+    def _partition_range_from_name(self, table_name, partition_name, interval):
+        """
+        Returns the (start, end) of a partition. The table's own `interval`
+        is tried first, then the others, as it may have changed since the
+        partition was created.
+        """
+        prefix = table_name + '_p'
+        if not partition_name.startswith(prefix):
+            return
+
+        suffix = partition_name[len(prefix):]
+        intervals = [interval] + [other for other in sorted(PARTITION_INTERVALS) if other != interval]
+        for other in intervals:
+            name_format, step = PARTITION_INTERVALS[other]
+            try:
+                start = datetime.strptime(suffix, name_format)
+            except ValueError:
+                continue
+
+            # strptime accepts '202611' as '%Y%m%d' (2026-01-01), so only
+            # take names that are formatted exactly like ours.
+            if start.strftime(name_format) != suffix:
+                continue
+
+            start = start.replace(tzinfo=tzutc())
+            return start, start + step
+
+    def _relation_exists(self, relation_name):
+        # Archived partitions live in another schema and are not visible
+        self.cur.execute("""
+            SELECT 1
+            FROM pg_class
+            WHERE relname = %(relation_name)s
+            AND pg_table_is_visible(oid)
+        """, {
+            'relation_name': relation_name,
+        })
+        return self.cur.fetchone() is not None
+
+    def _archived_relation_exists(self, relation_name):
+        self.cur.execute("""
+            SELECT 1
+            FROM pg_class
+            JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+            WHERE pg_class.relname = %(relation_name)s
+            AND pg_namespace.nspname = %(schema)s
+        """, {
+            'relation_name': relation_name,
+            'schema': settings.STORAGE_ARCHIVE_SCHEMA,
+        })
+        return self.cur.fetchone() is not None
+
+    def _archive_partition(self, table_name, partition_name):
+        # A partition recreated by late data may already have been archived
+        # once under the same name.
+        archive_name = partition_name
+        suffix = 1
+        while self._archived_relation_exists(archive_name):
+            archive_name = '%s_%d' % (partition_name, suffix)
+            suffix += 1
+
+        # The connection is in autocommit mode, so use an explicit
+        # transaction to never leave a detached partition behind.
+        self.cur.execute('BEGIN')
+        try:
+            self.cur.execute('ALTER TABLE ' + partition_name + ' NO INHERIT ' + table_name)
+            if archive_name != partition_name:
+                self.cur.execute('ALTER TABLE ' + partition_name + ' RENAME TO ' + archive_name)
+            self.cur.execute('CREATE SCHEMA IF NOT EXISTS ' + settings.STORAGE_ARCHIVE_SCHEMA)
+            self.cur.execute('ALTER TABLE ' + archive_name + ' SET SCHEMA ' + settings.STORAGE_ARCHIVE_SCHEMA)
+        except Exception:
+            self.cur.execute('ROLLBACK')
+            raise
+        self.cur.execute('COMMIT')
+
+    def _has_indexes(self, table_name):
+        self.cur.execute("""
+            SELECT 1
+            FROM pg_index
+            JOIN pg_class ON pg_class.oid = pg_index.indrelid
+            WHERE pg_class.relname = %(table_name)s
+            AND pg_table_is_visible(pg_class.oid)
+        """, {
+            'table_name': table_name,
+        })
+        return self.cur.fetchone() is not None
+
+    def _get_foreign_keys(self, table_name):
+        self.cur.execute("""
+            SELECT pg_constraint.conname, pg_get_constraintdef(pg_constraint.oid)
+            FROM pg_constraint
+            JOIN pg_class ON pg_class.oid = pg_constraint.conrelid
+            WHERE pg_class.relname = %(table_name)s
+            AND pg_table_is_visible(pg_class.oid)
+            AND pg_constraint.contype = 'f'
+        """, {
+            'table_name': table_name,
+        })
+        return self.cur.fetchall()
+
+    def _create_partition(self, table_name, partition_name, start, interval):
+        step = PARTITION_INTERVALS[interval][1]
+
+        if self._relation_exists(partition_name):
+            return
+
+        if settings.DEBUG:
+            print '** creating partition %s' % partition_name
+
+        # INHERITS only copies columns, NOT NULL and CHECK constraints, so
+        # primary keys, unique constraints and indexes are copied with LIKE.
+        self.cur.execute("""
+            CREATE TABLE IF NOT EXISTS """ + partition_name + """ (
+                LIKE """ + table_name + """ INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES,
+                CHECK (datetime >= %(start)s AND datetime < %(end)s)
+            ) INHERITS (""" + table_name + """)
+        """, {
+            'start': start,
+            'end': start + step,
+        })
+
+        # Foreign keys are not copied by either
+        for constraint_name, definition in self._get_foreign_keys(table_name):
+            self.cur.execute('ALTER TABLE ' + partition_name + ' ADD CONSTRAINT ' +
+                    partition_name + '_' + constraint_name + ' ' + definition)
+
+        # Parent tables without any indexes still get one for the
+        # device_key/datetime lookups the processors do.
+        if not self._has_indexes(partition_name):
+            self.cur.execute('CREATE INDEX ' + partition_name + '_device_key_datetime ON ' +
+                    partition_name + ' (device_key, datetime)')
+
+    def table_for(self, table_name, timestamp):
+        """
+        Returns the partition `timestamp` should be inserted into, creating it
+        if needed. Tables without a storage policy are returned as-is.
+        """
+        policy = self._get_policy(table_name)
+        if policy is None:
+            return table_name
+
+        interval = policy['interval']
+        start = trunc_datetime_to_interval(to_utc(timestamp), interval)
+        partition_name = self._partition_name(table_name, start, interval)
+
+        if partition_name not in self.known_partitions:
+            self._create_partition(table_name, partition_name, start, interval)
+            self.known_partitions.add(partition_name)
+
+        return partition_name
+
+    def create_upcoming_partitions(self):
+        now = datetime.now(tzutc())
+
+        for table_name, policy in settings.STORAGE_TABLES.items():
+            step = PARTITION_INTERVALS[policy['interval']][1]
+            for n in range(settings.STORAGE_PARTITIONS_AHEAD + 1):
+                self.table_for(table_name, now + step * n)
+
+    def _get_partitions(self, table_name):
+        self.cur.execute("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            WHERE parent.relname = %(table_name)s
+        """, {
+            'table_name': table_name,
+        })
+        return [row[0] for row in self.cur.fetchall()]
+
+    def expire_partitions(self):
+        now = datetime.now(tzutc())
+
+        for table_name, policy in settings.STORAGE_TABLES.items():
+            if policy.get('retention') is None:
+                continue
+
+            for partition_name in self._get_partitions(table_name):
+                partition_range = self._partition_range_from_name(table_name, partition_name, policy['interval'])
+                if partition_range is None or partition_range[1] > now - policy['retention']:
+                    continue
+
+                if policy.get('archive'):
+                    if settings.DEBUG:
+                        print '** archiving partition %s' % partition_name
+                    self._archive_partition(table_name, partition_name)
+                else:
+                    if settings.DEBUG:
+                        print '** dropping partition %s' % partition_name
+                    self.cur.execute('DROP TABLE ' + partition_name)
+
+                self.known_partitions.discard(partition_name)
+
+    def migrate_parent_rows(self):
+        """
+        Moves rows written before a table was partitioned out of the table
+        itself and into its partitions, one partition at a time. Only needs
+        to be run once, see `python connector.py migrate-storage`.
+        """
+        for table_name, policy in sorted(settings.STORAGE_TABLES.items()):
+            interval = policy['interval']
+            step = PARTITION_INTERVALS[interval][1]
+
+            self.cur.execute('SELECT min(datetime), max(datetime) FROM ONLY ' + table_name)
+            first, last = self.cur.fetchone()
+            if first is None:
+                continue
+
+            start = trunc_datetime_to_interval(to_utc(first), interval)
+            while start <= to_utc(last):
+                partition_name = self.table_for(table_name, start)
+                print '** moving rows from %s to %s' % (table_name, partition_name)
+
+                self.cur.execute("""
+                    WITH moved AS (
+                        DELETE FROM ONLY """ + table_name + """
+                        WHERE datetime >= %(start)s AND datetime < %(end)s
+                        RETURNING *
+                    )
+                    INSERT INTO """ + partition_name + """ SELECT * FROM moved
+                """, {
+                    'start': start,
+                    'end': start + step,
+                })
+                start += step
+
+            self.cur.execute('VACUUM ' + table_name)
+
+        # Moved rows may already be past their retention
+        self.expire_partitions()
+
+    def maintain(self):
+        now = datetime.now(tzutc())
+        if self.last_maintenance is not None and now - self.last_maintenance < settings.STORAGE_MAINTENANCE_INTERVAL:
+            return
+
+        self.create_upcoming_partitions()
+        self.expire_partitions()
+        self.last_maintenance = now
@@ -0,0 +1,51 @@
+# coding: utf-8
+import sys
+import types
+import unittest
+from datetime import datetime
+
+from dateutil.tz import tzutc
+
+try:
+    import settings
+except ImportError:
+    # settings/sensitive_settings.py is not checked in
+    sys.modules['settings'] = types.ModuleType('settings')
+
+from storage import StorageManager
+
+
+class FakeConnector:
+    cur = None
+
+
+class PartitionRangeFromNameTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = StorageManager(FakeConnector())
+
+    def assertRange(self, partition_name, interval, start, end):
+        self.assertEqual(
+            self.storage._partition_range_from_name('ts_pulses', partition_name, interval),
+            (datetime(*start, tzinfo=tzutc()), datetime(*end, tzinfo=tzutc())))
+
+    def test_month(self):
+        self.assertRange('ts_pulses_p202610', 'month', (2026, 10, 1), (2026, 11, 1))
+        self.assertRange('ts_pulses_p202611', 'month', (2026, 11, 1), (2026, 12, 1))
+        self.assertRange('ts_pulses_p202612', 'month', (2026, 12, 1), (2027, 1, 1))
+
+    def test_day(self):
+        self.assertRange('ts_pulses_p20261130', 'day', (2026, 11, 30), (2026, 12, 1))
+
+    def test_interval_changed(self):
+        # Months must not be read as days, e.g. '202611' as 2026-01-01
+        self.assertRange('ts_pulses_p202611', 'day', (2026, 11, 1), (2026, 12, 1))
+        self.assertRange('ts_pulses_p202612', 'day', (2026, 12, 1), (2027, 1, 1))
+        self.assertRange('ts_pulses_p20261130', 'month', (2026, 11, 30), (2026, 12, 1))
+
+    def test_other_tables(self):
+        self.assertEqual(self.storage._partition_range_from_name('ts_pulses', 'ts_pulses_old', 'month'), None)
+        self.assertEqual(self.storage._partition_range_from_name('ts_kwm', 'ts_pulses_p202611', 'month'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -55,7 +55,7 @@ class WristbandProcessor:
     def save_wristband_location(self):
         self.cur.execute("""
             INSERT INTO
-                ts_wristband_location
+                """ + self.connector.storage.table_for('ts_wristband_location', self.timestamp) + """
                 (device_key, datetime, nearest_device_key, rssi, packet_number)
             VALUES
                 (%(device_key)s, %(timestamp)s, %(nearest_device_key)s, %(rssi)s, %(packet_number)s)
@@ -72,7 +72,7 @@ class WristbandProcessor:
     def save_wristband_button_push(self):
         self.cur.execute("""
             INSERT INTO
-                ts_wristband_button_push
+                """ + self.connector.storage.table_for('ts_wristband_button_push', self.timestamp) + """
                 (device_key, datetime, packet_number)
             VALUES
                 (%(device_key)s, %(timestamp)s, %(packet_number)s)